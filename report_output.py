@@ -0,0 +1,206 @@
+"""
+Streaming output for the report scripts.
+
+Rows are plain dicts rendered one at a time as they are produced, in one of:
+  table  - fixed-width text (the original script output)
+  csv    - RFC 4180 CSV with a header row
+  jsonl  - one JSON object per line
+  html   - a self-contained <table>
+
+Sorted output uses an external merge sort: rows are sorted in chunks of bounded size,
+spilled to temporary files, and merged back lazily, so memory stays bounded no matter
+how many rows the source yields.
+
+Usage:
+    columns = [Column('name', 'Athlete', 25), Column('status', 'Status', 10)]
+    render(rows, columns, fmt='csv', sort_key='name')
+"""
+import csv
+import heapq
+import html
+import json
+import os
+import sys
+import tempfile
+
+FORMATS = ("table", "csv", "jsonl", "html")
+SORT_CHUNK_SIZE = 10000  # Rows held in memory per sorted run
+FLUSH_EVERY = 100        # Rows between flushes (the first row is always flushed immediately)
+
+
+class Column:
+    def __init__(self, key, header=None, width=None):
+        self.key = key
+        self.header = header or key
+        self.width = width  # Only used by the table format
+
+    def value(self, row):
+        v = row.get(self.key)
+        return "" if v is None else v
+
+
+class Renderer:
+    """Base renderer: begin() once, row() per row, end() once"""
+
+    def __init__(self, columns, out=None):
+        self.columns = columns
+        self.out = out or sys.stdout
+        self.count = 0
+
+    def begin(self):
+        pass
+
+    def row(self, row):
+        self.write_row(row)
+        self.count += 1
+        if self.count == 1 or self.count % FLUSH_EVERY == 0:
+            self.out.flush()
+
+    def write_row(self, row):
+        raise NotImplementedError
+
+    def end(self):
+        self.out.flush()
+
+
+class TableRenderer(Renderer):
+    def _line(self, values):
+        cells = []
+        for col, v in zip(self.columns, values):
+            text = str(v)
+            cells.append(f"{text[:col.width]:<{col.width}}" if col.width else text)
+        return " | ".join(cells).rstrip()
+
+    def _rule_width(self):
+        return sum((c.width or len(c.header)) for c in self.columns) + 3 * (len(self.columns) - 1)
+
+    def begin(self):
+        rule = "=" * self._rule_width()
+        self.out.write(rule + "\n")
+        self.out.write(self._line([c.header for c in self.columns]) + "\n")
+        self.out.write(rule + "\n")
+
+    def write_row(self, row):
+        self.out.write(self._line([c.value(row) for c in self.columns]) + "\n")
+
+    def end(self):
+        self.out.write("=" * self._rule_width() + "\n")
+        super().end()
+
+
+class CsvRenderer(Renderer):
+    def begin(self):
+        self.writer = csv.writer(self.out)
+        self.writer.writerow([c.header for c in self.columns])
+
+    def write_row(self, row):
+        self.writer.writerow([c.value(row) for c in self.columns])
+
+
+class JsonLinesRenderer(Renderer):
+    def write_row(self, row):
+        # Raw values (keeps numbers/nulls typed for downstream tools)
+        self.out.write(json.dumps({c.key: row.get(c.key) for c in self.columns}, default=str) + "\n")
+
+
+class HtmlRenderer(Renderer):
+    def begin(self):
+        self.out.write("<table>\n<thead><tr>")
+        self.out.write("".join(f"<th>{html.escape(c.header)}</th>" for c in self.columns))
+        self.out.write("</tr></thead>\n<tbody>\n")
+
+    def write_row(self, row):
+        cells = "".join(f"<td>{html.escape(str(c.value(row)))}</td>" for c in self.columns)
+        self.out.write(f"<tr>{cells}</tr>\n")
+
+    def end(self):
+        self.out.write("</tbody>\n</table>\n")
+        super().end()
+
+
+RENDERERS = {
+    "table": TableRenderer,
+    "csv": CsvRenderer,
+    "jsonl": JsonLinesRenderer,
+    "html": HtmlRenderer,
+}
+
+
+def _sort_value(v):
+    # None sorts first and never gets compared against other types
+    return (v is not None, v if v is not None else 0)
+
+
+def _spill(chunk):
+    f = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+    for row in chunk:
+        f.write(json.dumps(row, default=str) + "\n")
+    f.seek(0)
+    return f
+
+
+def _read_run(f):
+    with f:
+        for line in f:
+            yield json.loads(line)
+
+
+def external_sort(rows, key, reverse=False, chunk_size=SORT_CHUNK_SIZE):
+    """
+    Sort an iterable of dicts by one key (or a list of keys) with bounded memory.
+
+    Up to chunk_size rows are held at once; larger inputs are spilled to temporary
+    files as sorted runs and lazily merged. Rows must be JSON-serializable.
+    """
+    keys = [key] if isinstance(key, str) else list(key)
+
+    def sort_key(row):
+        return tuple(_sort_value(row.get(k)) for k in keys)
+
+    runs = []
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            chunk.sort(key=sort_key, reverse=reverse)
+            runs.append(_spill(chunk))
+            chunk = []
+
+    chunk.sort(key=sort_key, reverse=reverse)
+    if not runs:
+        # Everything fit in one chunk: no temp files needed
+        yield from chunk
+        return
+
+    if chunk:
+        runs.append(_spill(chunk))
+    yield from heapq.merge(*[_read_run(f) for f in runs], key=sort_key, reverse=reverse)
+
+
+def render(rows, columns, fmt="table", out=None, sort_key=None, reverse=False):
+    """Render rows as they arrive (or sorted, with bounded memory). Returns the number of rows written."""
+    if fmt not in RENDERERS:
+        raise ValueError(f"Unknown format '{fmt}'. Choose one of: {', '.join(FORMATS)}")
+
+    if sort_key:
+        rows = external_sort(rows, sort_key, reverse=reverse)
+
+    renderer = RENDERERS[fmt](columns, out)
+    renderer.begin()
+    for row in rows:
+        renderer.row(row)
+    renderer.end()
+    return renderer.count
+
+
+def info(msg, fmt="table"):
+    """Print a report header/summary line. Machine formats keep stdout clean by using stderr."""
+    print(msg, file=sys.stdout if fmt == "table" else sys.stderr)
+
+
+def add_output_arguments(parser):
+    """Add the shared --format / --sort / --desc options to an argparse parser"""
+    parser.add_argument("--format", choices=FORMATS, default=os.environ.get("REPORT_FORMAT", "table"),
+                        help="Output format (default: table, or $REPORT_FORMAT)")
+    parser.add_argument("--sort", help="Sort rows by this column (bounded-memory external sort)")
+    parser.add_argument("--desc", action="store_true", help="Sort descending")
@@ -0,0 +1,173 @@
+import requests
+import os
+import sys
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timezone
+
+# Configuration
+PROJECT_REF = "pvmknwhkgqloteqntqyr"
+SUPABASE_URL = f"https://{PROJECT_REF}.supabase.co"
+PROCESS_URL = f"{SUPABASE_URL}/functions/v1/strava-process-stage"
+
+# The claim/heartbeat/complete RPCs are only granted to the service role
+SUPABASE_SERVICE_ROLE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+
+CONCURRENCY = 2          # Stages processed in parallel (each run already fans out 5 Strava calls)
+LEASE_SECONDS = 300      # Lease per job; renewed by the heartbeat while the stage is processing
+HEARTBEAT_SECONDS = 60
+POLL_SECONDS = 10
+PROCESS_TIMEOUT = 600    # strava-process-stage can take minutes for large events
+
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+headers = {
+    "apikey": SUPABASE_SERVICE_ROLE_KEY or "",
+    "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+    "Content-Type": "application/json"
+}
+
+
+def log(msg):
+    print(f"[{datetime.now(timezone.utc).strftime('%H:%M:%S')}] {msg}", flush=True)
+
+
+def rpc(name, payload):
+    res = requests.post(f"{SUPABASE_URL}/rest/v1/rpc/{name}", headers=headers, json=payload, timeout=30)
+    if res.status_code != 200:
+        raise RuntimeError(f"RPC {name} failed: {res.status_code} - {res.text}")
+    return res.json()
+
+
+def claim_jobs(limit):
+    return rpc("claim_stage_processing_jobs", {
+        "p_worker_id": WORKER_ID,
+        "p_limit": limit,
+        "p_lease_seconds": LEASE_SECONDS
+    })
+
+
+def heartbeat(job, stop, lost):
+    """Keep the job's lease alive (and report elapsed time) until stop is set. Sets lost if another worker took it."""
+    started = time.monotonic()
+    while not stop.wait(HEARTBEAT_SECONDS):
+        try:
+            still_ours = rpc("heartbeat_stage_processing_job", {
+                "p_job_id": job['id'],
+                "p_worker_id": WORKER_ID,
+                "p_lease_seconds": LEASE_SECONDS,
+                "p_progress": {"phase": "processing", "elapsed_seconds": int(time.monotonic() - started)}
+            })
+            if not still_ours:
+                log(f"Lost lease on job {job['id']} (stage {job['stage_id']}); its outcome will not be recorded")
+                lost.set()
+                return
+        except Exception as e:
+            log(f"Heartbeat error for job {job['id']}: {e}")
+
+
+def run_job(job):
+    """
+    Run strava-process-stage for one job and record the outcome.
+
+    Returns 'completed', 'failed' or 'lost' (the lease was lost, so the outcome was not recorded).
+    """
+    log(f"Job {job['id']}: processing stage {job['stage_id']} (attempt {job['attempts']}, {job['requested_count']} coalesced requests)")
+
+    stop = threading.Event()
+    lost = threading.Event()
+    beat = threading.Thread(target=heartbeat, args=(job, stop, lost), daemon=True)
+    beat.start()
+
+    succeeded = False
+    result = None
+    error = None
+    try:
+        res = requests.post(PROCESS_URL, headers=headers, json={"stage_id": job['stage_id']}, timeout=PROCESS_TIMEOUT)
+        data = res.json() if res.headers.get('Content-Type', '').startswith('application/json') else {}
+        if res.status_code == 200 and data.get('success'):
+            succeeded = True
+            # Keep the summary only; the per-participant logs stay in the function logs
+            result = {k: data.get(k) for k in ('processed', 'segments_processed', 'message')}
+        else:
+            error = data.get('error') or f"HTTP {res.status_code}: {res.text[:500]}"
+    except Exception as e:
+        error = str(e)
+    finally:
+        stop.set()
+        beat.join()
+
+    # Not recorded when the job is no longer running under our lease (another worker reclaimed it)
+    recorded = False
+    try:
+        recorded = rpc("complete_stage_processing_job", {
+            "p_job_id": job['id'],
+            "p_worker_id": WORKER_ID,
+            "p_succeeded": succeeded,
+            "p_result": result,
+            "p_error": error
+        })
+    except Exception as e:
+        log(f"Job {job['id']}: could not record completion: {e}")
+
+    if not recorded:
+        reason = "lease lost" if lost.is_set() else "completion not recorded"
+        log(f"Job {job['id']}: LOST ({reason}) - run {'succeeded' if succeeded else 'failed'} but the job was not updated")
+        return 'lost'
+    if succeeded:
+        log(f"Job {job['id']}: done - {result.get('message')}")
+        return 'completed'
+    log(f"Job {job['id']}: FAILED - {error}")
+    return 'failed'
+
+
+def drain(once=False):
+    """Claim and run jobs with at most CONCURRENCY in flight. With once, exit when the queue is empty."""
+    log(f"Worker {WORKER_ID} started (concurrency {CONCURRENCY})")
+    done = failed = lost = 0
+    in_flight = set()
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        while True:
+            free = CONCURRENCY - len(in_flight)
+            jobs = []
+            if free > 0:
+                try:
+                    jobs = claim_jobs(free)
+                except Exception as e:
+                    log(f"Error claiming jobs: {e}")
+
+            for job in jobs:
+                in_flight.add(pool.submit(run_job, job))
+
+            if not in_flight:
+                if once:
+                    break
+                time.sleep(POLL_SECONDS)
+                continue
+
+            # Wait for a slot; time out so new jobs are picked up while long runs are going
+            finished, in_flight = wait(in_flight, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for f in finished:
+                outcome = f.result()
+                if outcome == 'completed':
+                    done += 1
+                elif outcome == 'failed':
+                    failed += 1
+                else:
+                    lost += 1
+            if finished:
+                log(f"Progress: {done} completed, {failed} failed, {lost} lost, {len(in_flight)} running")
+
+    log(f"Queue drained: {done} completed, {failed} failed, {lost} lost")
+
+
+if __name__ == "__main__":
+    if not SUPABASE_SERVICE_ROLE_KEY:
+        print("Error: Missing SUPABASE_SERVICE_ROLE_KEY environment variable")
+        sys.exit(1)
+
+    drain(once="--once" in sys.argv)
@@ -57,7 +57,31 @@ serve(async (req) => {
 
     if (resultsError) throw resultsError
 
-
+    // 2b. Smart Fetch: no results yet -> enqueue background processing.
+    // Concurrent requests for the same stage collapse into one job; callers poll
+    // stage_processing_jobs (or simply call this endpoint again) instead of re-triggering.
+    // The RPC is service role only and skips stages that haven't happened yet.
+    let processing = null
+    if (rawResults.length === 0) {
+        const supabaseAdmin = createClient(
+            supabaseUrl,
+            Deno.env.get('SUPABASE_SERVICE_ROLE_KEY') ?? ''
+        )
+        const { data: job, error: jobError } = await supabaseAdmin
+            .rpc('enqueue_stage_processing', { p_stage_id: stageId })
+
+        if (jobError) {
+            console.error('Error enqueueing stage processing:', jobError)
+        } else if (job && job.id) {
+            processing = {
+                job_id: job.id,
+                status: job.status,
+                requested_count: job.requested_count,
+                created_at: job.created_at,
+                finished_at: job.finished_at
+            }
+        }
+    }
 
     // 3. Manually fetch profiles for these results
     const userIds = rawResults.map(r => r.user_id)
@@ -85,6 +109,7 @@ serve(async (req) => {
             event_title: stageData.event.title
         },
         results: results,
+        processing: processing,
         debug_info: {
 
         }
@@ -0,0 +1,199 @@
+-- Migration: Stage Processing Job Queue
+-- Date: 2026-02-07
+-- Description: Coalesces "Smart Fetch" auto-processing requests into a single job per stage.
+-- fetch-stage-results enqueues instead of triggering strava-process-stage directly, and a worker
+-- (stage_job_worker.py) drains the queue with bounded parallelism using per-stage leases.
+
+-- ============================================================================
+-- 1. JOBS TABLE
+-- ============================================================================
+CREATE TABLE IF NOT EXISTS stage_processing_jobs (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    stage_id UUID REFERENCES event_stages(id) ON DELETE CASCADE NOT NULL,
+
+    status TEXT DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'completed', 'failed')),
+    requested_count INTEGER DEFAULT 1,      -- How many requests were coalesced into this job
+
+    -- Lease (held by the worker currently running the job)
+    locked_by TEXT,
+    lease_expires_at TIMESTAMPTZ,
+    attempts INTEGER DEFAULT 0,
+    max_attempts INTEGER DEFAULT 3,
+
+    -- Reporting
+    progress JSONB,                         -- Updated by the worker heartbeat
+    result JSONB,                           -- strava-process-stage response summary
+    error TEXT,
+
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- At most one active (queued or running) job per stage: this is what deduplicates requests
+CREATE UNIQUE INDEX IF NOT EXISTS idx_stage_processing_jobs_active_stage
+    ON stage_processing_jobs(stage_id) WHERE status IN ('queued', 'running');
+
+-- Claim order / status polling
+CREATE INDEX IF NOT EXISTS idx_stage_processing_jobs_status_created
+    ON stage_processing_jobs(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_stage_processing_jobs_stage_created
+    ON stage_processing_jobs(stage_id, created_at DESC);
+
+DROP TRIGGER IF EXISTS update_stage_processing_jobs_updated_at ON stage_processing_jobs;
+CREATE TRIGGER update_stage_processing_jobs_updated_at
+    BEFORE UPDATE ON stage_processing_jobs
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+-- ============================================================================
+-- 2. ROW LEVEL SECURITY
+-- ============================================================================
+-- Public read so callers can poll job status; writes only through the RPCs below
+ALTER TABLE stage_processing_jobs ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Public read stage processing jobs" ON stage_processing_jobs;
+CREATE POLICY "Public read stage processing jobs" ON stage_processing_jobs
+    FOR SELECT USING (true);
+
+-- ============================================================================
+-- 3. ENQUEUE (called by fetch-stage-results)
+-- ============================================================================
+-- Returns the active job for the stage, creating it if needed. Returns NULL without queueing
+-- anything for stages that haven't happened yet or already have results. A job that completed
+-- or failed within the last 10 minutes is returned as-is, so viewers of a stage with no rides
+-- yet (or a stage that keeps failing) don't re-trigger a full run on every page load.
+CREATE OR REPLACE FUNCTION enqueue_stage_processing(p_stage_id UUID)
+RETURNS stage_processing_jobs
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    v_job stage_processing_jobs;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM event_stages WHERE id = p_stage_id AND date <= CURRENT_DATE)
+       OR EXISTS (SELECT 1 FROM stage_results WHERE stage_id = p_stage_id) THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT * INTO v_job
+    FROM stage_processing_jobs
+    WHERE stage_id = p_stage_id
+      AND status IN ('completed', 'failed')
+      AND finished_at > NOW() - INTERVAL '10 minutes'
+    ORDER BY finished_at DESC
+    LIMIT 1;
+
+    IF FOUND THEN
+        RETURN v_job;
+    END IF;
+
+    INSERT INTO stage_processing_jobs (stage_id)
+    VALUES (p_stage_id)
+    ON CONFLICT (stage_id) WHERE status IN ('queued', 'running')
+    DO UPDATE SET requested_count = stage_processing_jobs.requested_count + 1
+    RETURNING * INTO v_job;
+
+    RETURN v_job;
+END;
+$$;
+
+-- ============================================================================
+-- 4. WORKER RPCs (service role only)
+-- ============================================================================
+
+-- Claim up to p_limit jobs: queued ones, plus running ones whose lease expired (crashed worker)
+CREATE OR REPLACE FUNCTION claim_stage_processing_jobs(p_worker_id TEXT, p_limit INTEGER DEFAULT 1, p_lease_seconds INTEGER DEFAULT 300)
+RETURNS SETOF stage_processing_jobs
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    -- Give up on abandoned jobs that already used all their attempts
+    UPDATE stage_processing_jobs
+    SET status = 'failed',
+        error = COALESCE(error, 'Lease expired after final attempt'),
+        locked_by = NULL,
+        lease_expires_at = NULL,
+        finished_at = NOW()
+    WHERE status = 'running'
+      AND lease_expires_at < NOW()
+      AND attempts >= max_attempts;
+
+    RETURN QUERY
+    UPDATE stage_processing_jobs j
+    SET status = 'running',
+        locked_by = p_worker_id,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        attempts = j.attempts + 1,
+        started_at = COALESCE(j.started_at, NOW())
+    WHERE j.id IN (
+        SELECT id FROM stage_processing_jobs
+        WHERE status = 'queued'
+           OR (status = 'running' AND lease_expires_at < NOW())
+        ORDER BY created_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING j.*;
+END;
+$$;
+
+-- Extend the lease and report progress. Returns false if the lease was lost to another worker.
+CREATE OR REPLACE FUNCTION heartbeat_stage_processing_job(p_job_id UUID, p_worker_id TEXT, p_lease_seconds INTEGER DEFAULT 300, p_progress JSONB DEFAULT NULL)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    UPDATE stage_processing_jobs
+    SET lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        progress = COALESCE(p_progress, progress)
+    WHERE id = p_job_id
+      AND status = 'running'
+      AND locked_by = p_worker_id;
+
+    RETURN FOUND;
+END;
+$$;
+
+-- Finish a job. Failed jobs go back to the queue until max_attempts is reached.
+CREATE OR REPLACE FUNCTION complete_stage_processing_job(p_job_id UUID, p_worker_id TEXT, p_succeeded BOOLEAN, p_result JSONB DEFAULT NULL, p_error TEXT DEFAULT NULL)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    UPDATE stage_processing_jobs
+    SET status = CASE
+            WHEN p_succeeded THEN 'completed'
+            WHEN attempts < max_attempts THEN 'queued'
+            ELSE 'failed'
+        END,
+        result = COALESCE(p_result, result),
+        error = p_error,
+        locked_by = NULL,
+        lease_expires_at = NULL,
+        finished_at = CASE WHEN p_succeeded OR attempts >= max_attempts THEN NOW() ELSE NULL END
+    WHERE id = p_job_id
+      AND status = 'running'
+      AND locked_by = p_worker_id;
+
+    RETURN FOUND;
+END;
+$$;
+
+-- ============================================================================
+-- 5. PERMISSIONS
+-- ============================================================================
+REVOKE EXECUTE ON FUNCTION enqueue_stage_processing(UUID) FROM public;
+REVOKE EXECUTE ON FUNCTION claim_stage_processing_jobs(TEXT, INTEGER, INTEGER) FROM public;
+REVOKE EXECUTE ON FUNCTION heartbeat_stage_processing_job(UUID, TEXT, INTEGER, JSONB) FROM public;
+REVOKE EXECUTE ON FUNCTION complete_stage_processing_job(UUID, TEXT, BOOLEAN, JSONB, TEXT) FROM public;
+
+-- fetch-stage-results enqueues with a service role client
+GRANT EXECUTE ON FUNCTION enqueue_stage_processing(UUID) TO service_role;
+GRANT EXECUTE ON FUNCTION claim_stage_processing_jobs(TEXT, INTEGER, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION heartbeat_stage_processing_job(UUID, TEXT, INTEGER, JSONB) TO service_role;
+GRANT EXECUTE ON FUNCTION complete_stage_processing_job(UUID, TEXT, BOOLEAN, JSONB, TEXT) TO service_role;
@@ -0,0 +1,17 @@
+-- Migration: updated_at Triggers for the Parquet Export
+-- Date: 2026-02-09
+-- Description: export_parquet.py exports incrementally by updated_at, which only works if every
+-- write bumps it. Upserts such as the strava-webhook one into stage_results never set it, so
+-- keep it current with the same trigger segment_results already has.
+
+DROP TRIGGER IF EXISTS update_stage_results_updated_at ON stage_results;
+CREATE TRIGGER update_stage_results_updated_at
+    BEFORE UPDATE ON stage_results
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();
+
+DROP TRIGGER IF EXISTS update_workout_metrics_updated_at ON workout_metrics;
+CREATE TRIGGER update_workout_metrics_updated_at
+    BEFORE UPDATE ON workout_metrics
+    FOR EACH ROW
+    EXECUTE FUNCTION update_updated_at_column();